@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        from django.conf import settings
+        from .logic import Rules, configure_shoe_pools, get_shoe_pool
+
+        configure_shoe_pools(settings.SHOE_POOL_SIZE)
+        #Fill the pool for the configured table now, so the first deal doesn't find it empty.
+        get_shoe_pool(Rules(**settings.GAME_RULES).decks).start()
@@ -0,0 +1,126 @@
+from .logic import RANKS, Rules, card_value
+
+#Integer-card round engine for simulation. Plays one round with the same rules and settlement as the functions in logic.py, but on
+#plain ints instead of Card/Hand/GameState objects. Cards are codes 0..51 (rank index * 4 + suit index, as in state_store), and the
+#shoe is drawn from the end like Deck.draw(). game/verify.py checks it against the reference functions.
+
+_RANK = [code // 4 for code in range(52)]
+_VALUE = [1 if card_value(RANKS[r]) == 11 else card_value(RANKS[r]) for r in _RANK]  # ace counts 1 here
+
+
+class ShoeExhausted(Exception):
+    pass
+
+
+def _draw(shoe: list) -> int:
+    if not shoe:
+        raise ShoeExhausted()
+    return shoe.pop()
+
+#Best total of a hand given its hard total (aces as 1) and whether it holds an ace.
+def _best(total: int, ace: bool) -> int:
+    return total + 10 if ace and total + 10 <= 21 else total
+
+#Plays one round: bet, deal, insurance answer (only used when offered) and then `actions` ("hit", "stand", "double", "split",
+#"surrender") while the round is live, standing once they run out. Returns (bankroll, final status, dealer best total, cards left).
+def play_round(shoe: list, bankroll: int, bet: int, actions, insurance: bool, rules: Rules) -> tuple:
+    if bet <= 0 or bet > bankroll:
+        return (bankroll, "waiting_for_bet", 0, len(shoe))
+    bankroll -= bet
+
+    p1 = _draw(shoe)
+    d1 = _draw(shoe)
+    p2 = _draw(shoe)
+    d2 = _draw(shoe)
+    d_total = _VALUE[d1] + _VALUE[d2]
+    d_ace = _VALUE[d1] == 1 or _VALUE[d2] == 1
+    d_blackjack = d_ace and d_total == 11
+
+    if rules.insurance and _VALUE[d1] == 1 and insurance:
+        cost = bet // 2
+        if cost <= bankroll:
+            bankroll -= cost
+            if d_blackjack:
+                bankroll += cost * 3
+
+    #Hands are [cards, hard total, has ace, bet]; cards are only needed for pair checks and two-card rules.
+    hands = [[[p1, p2], _VALUE[p1] + _VALUE[p2], _VALUE[p1] == 1 or _VALUE[p2] == 1, bet]]
+    player_blackjack = hands[0][2] and hands[0][1] == 11
+    if player_blackjack:
+        bankroll += bet if d_blackjack else rules.blackjack_return(bet)
+        return (bankroll, "waiting_for_bet", _best(d_total, d_ace), len(shoe))
+    if d_blackjack:
+        return (bankroll, "waiting_for_bet", _best(d_total, d_ace), len(shoe))
+
+    split = False
+    active = 0
+    actions = iter(actions)
+    while active < len(hands):
+        hand = hands[active]
+        action = next(actions, "stand")
+
+        if action == "hit":
+            card = _draw(shoe)
+            hand[0].append(card)
+            hand[1] += _VALUE[card]
+            hand[2] = hand[2] or _VALUE[card] == 1
+            if hand[1] > 21:
+                if not split:
+                    return (bankroll, "player_bust", _best(d_total, d_ace), len(shoe))
+                active += 1
+        elif action == "stand":
+            active += 1
+        elif action == "double":
+            if split and not rules.double_after_split:
+                continue
+            if bankroll < hand[3] or len(hand[0]) != 2:
+                continue
+            bankroll -= hand[3]
+            hand[3] *= 2
+            card = _draw(shoe)
+            hand[0].append(card)
+            hand[1] += _VALUE[card]
+            hand[2] = hand[2] or _VALUE[card] == 1
+            if hand[1] > 21 and not split:
+                return (bankroll, "player_bust", _best(d_total, d_ace), len(shoe))
+            active += 1
+        elif action == "split":
+            cards = hand[0]
+            if len(cards) != 2 or _RANK[cards[0]] != _RANK[cards[1]]:
+                continue
+            if len(hands) - 1 >= rules.max_splits or bankroll < hand[3]:
+                continue
+            bankroll -= hand[3]
+            c1, c2 = cards
+            n1 = _draw(shoe)
+            n2 = _draw(shoe)
+            hands[active:active + 1] = [
+                [[c1, n1], _VALUE[c1] + _VALUE[n1], _VALUE[c1] == 1 or _VALUE[n1] == 1, hand[3]],
+                [[c2, n2], _VALUE[c2] + _VALUE[n2], _VALUE[c2] == 1 or _VALUE[n2] == 1, hand[3]],
+            ]
+            split = True
+        elif action == "surrender":
+            if rules.surrender and not split and len(hand[0]) == 2:
+                bankroll += hand[3] // 2
+                return (bankroll, "waiting_for_bet", _best(d_total, d_ace), len(shoe))
+
+    #Dealer draws once if any hand is still live, then every hand is settled with its own bet.
+    live = [h for h in hands if h[1] <= 21]
+    if live:
+        hits = rules.dealer_hits
+        while hits[d_total][d_ace]:
+            card = _draw(shoe)
+            d_total += _VALUE[card]
+            d_ace = d_ace or _VALUE[card] == 1
+    d_best = _best(d_total, d_ace)
+
+    for h in live:
+        p_best = _best(h[1], h[2])
+        if d_best > 21 or d_best < p_best:
+            bankroll += h[3] * 2
+        elif d_best == p_best:
+            bankroll += h[3]
+
+    if split:
+        return (bankroll, "waiting_for_bet", d_best, len(shoe))
+    return (bankroll, "dealer_bust" if d_best > 21 else "waiting_for_bet", d_best, len(shoe))
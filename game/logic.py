@@ -1,5 +1,8 @@
 
+import os
+import queue
 import random
+import threading
 from dataclasses import dataclass, field
 from typing import List, Tuple
 
@@ -24,23 +27,168 @@ def card_value(rank: str) -> int:
         return 11 
     return int(rank)
 
-#Simple deck class; Initalized deck with shuffling and draws cards from top of the deck and removes it from deck. When deck runs out of cards, re-shuffles and continues. 
+BLACKJACK_PAYOUTS = ((3, 2), (6, 5))
+MAX_SPLITS = 3  # the state store packs the limit into one byte; four hands is the usual table maximum
+
+#Table rules. Frozen so a Rules object is hashable and can be used as a cache key for strategy and simulation results. When it is built,
+#the options the hot paths care about are compiled into lookup tables and payout constants, so dealing and settling never branch on config.
+@dataclass(frozen=True)
+class Rules:
+    decks: int = 1
+    hit_soft_17: bool = False
+    blackjack_payout: Tuple[int, int] = (3, 2)
+    double_after_split: bool = True
+    surrender: bool = False
+    insurance: bool = False
+    max_splits: int = 1  # resplit limit: how many times one round may be split, at most MAX_SPLITS (four hands)
+    dealer_hits: tuple = field(init=False, repr=False, compare=False)
+    blackjack_multiplier: int = field(init=False, repr=False, compare=False)
+    blackjack_divisor: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not 1 <= self.decks <= 8:
+            raise ValueError("Decks must be between 1 and 8.")
+        if tuple(self.blackjack_payout) not in BLACKJACK_PAYOUTS:
+            raise ValueError("Blackjack payout must be 3:2 or 6:5.")
+        if not 0 <= self.max_splits <= MAX_SPLITS:
+            raise ValueError(f"Resplit limit must be between 0 and {MAX_SPLITS}.")
+        object.__setattr__(self, "blackjack_payout", tuple(self.blackjack_payout))
+
+        #dealer_hits[min_value][has_ace] -> does the dealer draw? Same rule dealer_play() always used: under 17, or soft 17 when H17.
+        table = []
+        for min_v in range(32):
+            hard = min_v < 17
+            soft_best = min_v + 10 if min_v + 10 <= 21 else min_v
+            soft = soft_best < 17 or (self.hit_soft_17 and min_v == 7)
+            table.append((hard, soft))
+        object.__setattr__(self, "dealer_hits", tuple(table))
+
+        #Blackjack returns stake plus winnings: bet * (num + den) // den, e.g. 3:2 -> bet * 5 // 2.
+        num, den = self.blackjack_payout
+        object.__setattr__(self, "blackjack_multiplier", num + den)
+        object.__setattr__(self, "blackjack_divisor", den)
+
+    def blackjack_return(self, bet: int) -> int:
+        return bet * self.blackjack_multiplier // self.blackjack_divisor
+
+DEFAULT_RULES = Rules()
+
+SHOE_POOL_SIZE = 4
+
+#Bounded pool of ready shuffled shoes for one deck count. A background thread shuffles new shoes whenever there is room, so taking a
+#shoe is a single queue pop. If the pool is ever empty the shoe is shuffled inline and counted as a starvation.
+class ShoePool:
+    def __init__(self, decks: int, size: int = SHOE_POOL_SIZE):
+        self.decks = decks
+        self.size = size
+        self._lock = threading.Lock()
+        self._pid = None
+        self.taken = 0
+        self.starved = 0
+
+    def _build(self) -> List[Card]:
+        cards = [Card(rank, suit) for _ in range(self.decks) for suit in SUITS for rank in RANKS]
+        random.shuffle(cards)
+        return cards
+
+    def _fill(self, shoes: queue.Queue, stopped: threading.Event):
+        while not stopped.is_set():
+            shoes.put(self._build())  # blocks while the pool is full
+
+    #Starts the filler thread. The game app calls this at startup; take() calls it again in a forked worker (threads do not survive fork),
+    #where the counters inherited from the parent are reset.
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._shoes = queue.Queue(maxsize=self.size)
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(
+                target=self._fill, args=(self._shoes, self._stopped), name=f"shoe-pool-{self.decks}", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+            self.taken = 0
+            self.starved = 0
+
+    #Stops the filler thread. Draining the queue wakes a filler blocked on a full pool; it puts at most one more shoe and then exits.
+    def stop(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = None
+                return
+            self._stopped.set()
+            self._pid = None
+            while True:
+                try:
+                    self._shoes.get_nowait()
+                except queue.Empty:
+                    break
+
+    def take(self) -> List[Card]:
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            shoe = self._shoes.get_nowait()
+            starved = False
+        except queue.Empty:
+            shoe = self._build()
+            starved = True
+        with self._lock:
+            self.taken += 1
+            self.starved += starved
+        return shoe
+
+    def metrics(self) -> dict:
+        return {
+            "decks": self.decks,
+            "size": self.size,
+            "ready": self._shoes.qsize() if self._pid == os.getpid() else 0,
+            "taken": self.taken,
+            "starved": self.starved,
+        }
+
+_shoe_pools = {}
+_shoe_pools_lock = threading.Lock()
+
+def get_shoe_pool(decks: int) -> ShoePool:
+    pool = _shoe_pools.get(decks)
+    if pool is None:
+        with _shoe_pools_lock:
+            pool = _shoe_pools.setdefault(decks, ShoePool(decks, SHOE_POOL_SIZE))
+    return pool
+
+#Sets the size of every shoe pool. Call before dealing starts (the game app does this from settings.SHOE_POOL_SIZE). Existing pools are
+#stopped and replaced by new ones of the new size on next use.
+def configure_shoe_pools(size: int):
+    global SHOE_POOL_SIZE
+    if size < 1:
+        raise ValueError("Shoe pool size must be at least 1.")
+    SHOE_POOL_SIZE = size
+    with _shoe_pools_lock:
+        for pool in _shoe_pools.values():
+            pool.stop()
+        _shoe_pools.clear()
+
+def shoe_pool_metrics() -> list:
+    return [pool.metrics() for pool in list(_shoe_pools.values())]
+
+#Simple deck class; A new deck is a ready shuffled shoe taken from the shoe pool. Draws cards from top of the deck and removes it from deck. When deck runs out of cards, takes a fresh shoe and continues. 
 @dataclass
 class Deck:
     cards: List[Card] = field(default_factory=list)
+    decks: int = 1
 
     def __post_init__(self):
         if not self.cards:
-            self.cards = [Card(rank, suit) for suit in SUITS for rank in RANKS]
-            self.shuffle()
+            self.cards = get_shoe_pool(self.decks).take()
 
     def shuffle(self):
         random.shuffle(self.cards)
 
     def draw(self) -> Card:
         if not self.cards:
-            self.__post_init__()  # reshuffle new deck if exhausted
-            random.shuffle(self.cards)
+            self.cards = get_shoe_pool(self.decks).take()  # fresh shoe if exhausted
         return self.cards.pop()
 
 #Contains methods related to the player hand. Ace logic: Try to use an Ace as an 11 if it doesn't bust. If it does bust, use the Ace as a 1. 
@@ -83,7 +231,7 @@ class Hand:
 #determines which state of the game the user is in and other attributes.  
 @dataclass
 class GameState:
-    deck: Deck = field(default_factory=Deck)
+    deck: Deck = None  # defaults to a shoe for rules.decks
     player: Hand = field(default_factory=Hand)
     dealer: Hand = field(default_factory=Hand)
     status: str = "waiting_for_bet"  # can be "playing", "split_playing", etc.
@@ -92,6 +240,12 @@ class GameState:
     current_bet: int = 0
     hands: list = field(default_factory=list)  # for split hands
     active_hand_index: int = 0
+    rules: Rules = DEFAULT_RULES
+    hand_bets: list = field(default_factory=list)  # bet on each split hand
+
+    def __post_init__(self):
+        if self.deck is None or self.deck.decks != self.rules.decks:
+            self.deck = Deck(decks=self.rules.decks)
 
 # ---------------------------------------
 # Core Gameplay Logic
@@ -124,7 +278,6 @@ def start_game(state: GameState | None = None) -> GameState:
 
     g.player = Hand()
     g.dealer = Hand()
-    g.deck.shuffle()
     g.message = ""
 
     #Deal initial cards
@@ -133,14 +286,24 @@ def start_game(state: GameState | None = None) -> GameState:
     g.player.add(g.deck.draw())
     g.dealer.add(g.deck.draw())
 
-    #Check blackjacks (21 on initial 2 cards)
+    #With insurance on, an Ace upcard stops here until the player answers (see player_insurance).
+    if g.rules.insurance and g.dealer.cards[0].rank == "A":
+        g.message = "Dealer shows an Ace. Insurance?"
+        g.status = "insurance_offered"
+        return g
+
+    return check_blackjacks(g)
+
+#Check blackjacks (21 on initial 2 cards). Settles the round if either side has one, otherwise hands control to the player.
+def check_blackjacks(g: GameState) -> GameState:
     if g.player.is_blackjack():
         if g.dealer.is_blackjack():
             g.message = "Push (both blackjack)."
             g.bankroll += g.current_bet  # refund
         else:
-            g.message = "Player has Blackjack! You win 1.5x!"
-            g.bankroll += int(g.current_bet * 2.5)
+            num, den = g.rules.blackjack_payout
+            g.message = f"Player has Blackjack! You win {num}:{den}!"
+            g.bankroll += g.rules.blackjack_return(g.current_bet)
         g.current_bet = 0
         g.status = "waiting_for_bet"
     elif g.dealer.is_blackjack():
@@ -152,6 +315,46 @@ def start_game(state: GameState | None = None) -> GameState:
 
     return g
 
+#Insurance side bet of half the main bet, offered when the dealer shows an Ace. Pays 2:1 if the dealer has blackjack. Either way the
+#round then continues with the normal blackjack checks.
+def player_insurance(state: GameState, accept: bool) -> GameState:
+    if state.status != "insurance_offered":
+        return state
+
+    note = ""
+    if accept:
+        cost = state.current_bet // 2
+        if cost > state.bankroll:
+            state.message = "Not enough funds for insurance."
+            return state
+        state.bankroll -= cost
+        if state.dealer.is_blackjack():
+            state.bankroll += cost * 3
+            note = "Insurance pays 2:1."
+        else:
+            note = "Insurance lost."
+
+    state.message = ""
+    state = check_blackjacks(state)
+    state.message = " ".join(m for m in (note, state.message) if m)
+    return state
+
+#Late surrender: give up the first two cards of an unsplit hand and get half the bet back.
+def player_surrender(state: GameState) -> GameState:
+    if not state.rules.surrender:
+        state.message = "Surrender is not allowed at this table."
+        return state
+    if state.status != "playing" or len(state.player.cards) != 2:
+        state.message = "Can only surrender on the first move of a hand."
+        return state
+
+    refund = state.current_bet // 2
+    state.bankroll += refund
+    state.message = f"Player surrenders. ${refund} returned."
+    state.current_bet = 0
+    state.status = "waiting_for_bet"
+    return state
+
 #Adds a card to the player's current hand and checks for a player bust. Updates gameState. 
 def player_hit(state: GameState) -> GameState:
     if state.status not in ("playing", "split_playing"):
@@ -172,23 +375,28 @@ def player_hit(state: GameState) -> GameState:
 
     return state
 
-#Dealer play logic. Dealer must stand on 17 (Standard for most casinos). Checks if dealer has won, lost, or busts. Updates bankroll in gameState accordingly. 
+#Dealer draws until the rules say stand. Dealer must stand on 17 (hits soft 17 only under H17), looked up in the compiled rules table.
+def dealer_draw(state: GameState) -> GameState:
+    hits = state.rules.dealer_hits
+    has_ace = any(c.rank == "A" for c in state.dealer.cards)
+    min_v = state.dealer.values()[0]
+    while hits[min_v][has_ace]:
+        card = state.deck.draw()
+        state.dealer.add(card)
+        has_ace = has_ace or card.rank == "A"
+        min_v = state.dealer.values()[0]
+    return state
+
+#Dealer play logic. Checks if dealer has won, lost, or busts. Updates bankroll in gameState accordingly. 
 #Since this will always be the last turn, resets status to wait for player bet. 
-def dealer_play(state: GameState, hit_soft_17: bool = False) -> GameState:
-    while True:
-        min_v, max_v = state.dealer.values()
-        best = state.dealer.best_value()
-        is_soft_17 = (min_v + 10 == 17) if any(c.rank == "A" for c in state.dealer.cards) else False
-        if best < 17 or (is_soft_17 and hit_soft_17):
-            state.dealer.add(state.deck.draw())
-            if state.dealer.is_bust():
-                state.status = "dealer_bust"
-                state.message = f"Dealer busts with {state.dealer.best_value()}!"
-                state.bankroll += state.current_bet * 2
-                state.current_bet = 0
-                return state
-            continue
-        break
+def dealer_play(state: GameState) -> GameState:
+    state = dealer_draw(state)
+    if state.dealer.is_bust():
+        state.status = "dealer_bust"
+        state.message = f"Dealer busts with {state.dealer.best_value()}!"
+        state.bankroll += state.current_bet * 2
+        state.current_bet = 0
+        return state
 
     p_best = state.player.best_value()
     d_best = state.dealer.best_value()
@@ -211,6 +419,8 @@ def dealer_play(state: GameState, hit_soft_17: bool = False) -> GameState:
 
 #Player stands, keeps current value and let's the dealer play. 
 def player_stand(state: GameState) -> GameState:
+    if state.status not in ("playing", "split_playing"):
+        return state
     if state.status.startswith("split"):
         state = advance_to_next_hand(state)
         return state
@@ -219,16 +429,27 @@ def player_stand(state: GameState) -> GameState:
         return state
 
 #Simple double down logic. Checks balance to ensure player has enough to double down. Calls player_stand since player is only allowed to draw one card. 
+#On a split hand only that hand's bet is doubled, and only if the rules allow doubling after a split.
 def player_double_down(state: GameState) -> GameState:
-    if state.bankroll < state.current_bet:
+    if state.status not in ("playing", "split_playing"):
+        return state
+    split = state.status == "split_playing" and state.hands
+    if split and not state.rules.double_after_split:
+        state.message = "Doubling after a split is not allowed."
+        return state
+    bet = state.hand_bets[state.active_hand_index] if split else state.current_bet
+    if state.bankroll < bet:
         state.message = "Not enough funds to double down."
         return state
     if len(state.player.cards) != 2:
         state.message = "Can only double down on the first move of a hand."
         return state
 
-    state.bankroll -= state.current_bet
-    state.current_bet *= 2
+    state.bankroll -= bet
+    if split:
+        state.hand_bets[state.active_hand_index] *= 2
+    else:
+        state.current_bet *= 2
     state.player.add(state.deck.draw())
 
     if state.player.is_bust():
@@ -252,23 +473,36 @@ def player_double_down(state: GameState) -> GameState:
         return state
 
 #Player split logic - Player can only split if the cards are the rank (this differs based on casino). If player does split, initalize a second hand with the second card. Sets active hand to hand 1.
-#Once that hand is concluded, switch to hand 2. Once both hands are done, dealer play starts. 
+#Once that hand is concluded, switch to hand 2. Once all hands are done, dealer play starts. A split hand that is itself a pair can be split again, up to the rules' resplit limit.
 def player_split(state: GameState) -> GameState:
+    if state.status not in ("playing", "split_playing"):
+        return state
     if len(state.player.cards) != 2 or state.player.cards[0].rank != state.player.cards[1].rank:
         state.message = "Cannot split unless you have a pair."
         return state
-    if state.bankroll < state.current_bet:
+    splits = len(state.hands) - 1 if state.hands else 0
+    if splits >= state.rules.max_splits:
+        state.message = "No more splits allowed."
+        return state
+    i = state.active_hand_index if state.hands else 0
+    bet = state.hand_bets[i] if state.hands else state.current_bet
+    if state.bankroll < bet:
         state.message = "Not enough funds to split."
         return state
 
-    state.bankroll -= state.current_bet
+    state.bankroll -= bet
     card1, card2 = state.player.cards
     hand1 = Hand([card1, state.deck.draw()])
     hand2 = Hand([card2, state.deck.draw()])
-    state.hands = [hand1, hand2]
-    state.active_hand_index = 0
+    if state.hands:
+        state.hands[i:i + 1] = [hand1, hand2]
+        state.hand_bets[i:i + 1] = [bet, bet]
+    else:
+        state.hands = [hand1, hand2]
+        state.hand_bets = [bet, bet]
+    state.active_hand_index = i
     state.player = state.hands[state.active_hand_index]
-    state.message = "Hand split — playing Hand 1."
+    state.message = f"Hand split — playing Hand {i + 1}."
     state.status = "split_playing"
     return state
 
@@ -285,34 +519,32 @@ def advance_to_next_hand(state: GameState) -> GameState:
         state.status = "split_playing"
         return state
 
-    # All hands done. Dealer plays and compare results
+    # All hands done. Dealer plays (once, if any hand is still live) and each hand is settled with its own bet
     results = []
-    dealer_played = False
-    for i, hand in enumerate(state.hands, start=1):
-        state.player = hand
+    if not all(hand.is_bust() for hand in state.hands):
+        state = dealer_draw(state)
+    for i, (hand, bet) in enumerate(zip(state.hands, state.hand_bets), start=1):
         if hand.is_bust():
             results.append(f"Hand {i}: Bust ({hand.best_value()}) – Lose")
             continue
-        if not dealer_played:
-            state = dealer_play(state)
-            dealer_played = True
         p_best = hand.best_value()
         d_best = state.dealer.best_value()
         if d_best > 21:
             results.append(f"Hand {i}: Dealer busts with {d_best}! Player wins ({p_best})")
-            state.bankroll += state.current_bet * 2
+            state.bankroll += bet * 2
         elif d_best > p_best:
             results.append(f"Hand {i}: Dealer wins ({d_best} vs {p_best})")
         elif d_best < p_best:
             results.append(f"Hand {i}: Player wins ({p_best} vs {d_best})")
-            state.bankroll += state.current_bet * 2
+            state.bankroll += bet * 2
         else:
             results.append(f"Hand {i}: Push ({p_best})")
-            state.bankroll += state.current_bet
+            state.bankroll += bet
 
     state.message = " | ".join(results)
     state.status = "waiting_for_bet"
     state.hands = []
+    state.hand_bets = []
     state.active_hand_index = 0
     state.player = Hand()
     state.current_bet = 0
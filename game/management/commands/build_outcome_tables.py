@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from game.logic import Rules
+from game.outcome_tables import DEFAULT_PATH, VARIANTS, build_tables
+
+
+#Build step for the precomputed EV tables in game/outcome_tables.py. Run once per deploy (or whenever settings.GAME_RULES changes);
+#builds the default variants plus the table's configured rules.
+class Command(BaseCommand):
+    help = "Precompute EV tables for every starting hand and dealer upcard and write them to a binary file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=str(DEFAULT_PATH), help="Where to write the table file.")
+
+    def handle(self, *args, **options):
+        path = build_tables(options["output"], VARIANTS + (Rules(**settings.GAME_RULES),))
+        self.stdout.write(self.style.SUCCESS(f"Wrote outcome tables to {path}"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from game.views import STORE
+
+
+#Drops superseded and deleted records from the game-state store. Safe to run while the server is up.
+class Command(BaseCommand):
+    help = "Compact the game-state store shards."
+
+    def handle(self, *args, **options):
+        dropped = STORE.compact()
+        self.stdout.write(self.style.SUCCESS(f"Dropped {dropped} stale records"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game import verify
+
+
+#Runs the differential harness in game/verify.py: optimized engines vs the reference rules in game/logic.py.
+class Command(BaseCommand):
+    help = "Check optimized engines against the reference game logic on randomized seeded rounds."
+
+    def add_arguments(self, parser):
+        verify.add_arguments(parser)
+
+    def handle(self, *args, **options):
+        if verify.run(options, self.stdout.write):
+            raise CommandError("Engines disagree with the reference logic.")
@@ -0,0 +1,287 @@
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from pathlib import Path
+
+from .logic import BLACKJACK_PAYOUTS, DEFAULT_RULES, Rules, card_value
+
+#Precomputed EV tables for every (player two-card hand, dealer upcard) pair. The tables are built once with build_tables() (see the
+#build_outcome_tables management command) and written to a flat binary file. Workers map that file read-only with mmap on first lookup,
+#so every process shares the same pages and a lookup is just an index into a memoryview of doubles.
+#
+#All EVs are per unit of the initial bet and are conditional on the dealer NOT having blackjack, since start_game() settles dealer
+#blackjacks before the player gets to act. Split EVs play each split hand on with stand/hit/double (double only when the rules allow
+#it after a split) and do not model resplits; rows that are not a pair hold NaN in the split column. Surrender is a late surrender
+#and always returns half the bet.
+
+DEFAULT_PATH = Path(__file__).resolve().parent / "data" / "outcome_tables.bin"
+
+ACTIONS = ("stand", "hit", "double", "split", "surrender")
+#Rule sets built by default. The build command adds the table's own rules from settings.GAME_RULES. A variant is keyed by the rules that
+#change the numbers: decks, hit_soft_17, the blackjack payout and double after split.
+VARIANTS = (DEFAULT_RULES, Rules(hit_soft_17=True))
+
+MAGIC = b"BJEV"
+VERSION = 3
+_HEADER = struct.Struct("<4sHBxHHH4x")  # magic, version, byteorder, variants, pairs, upcards
+_VARIANT = struct.Struct("<BBBBI")  # decks, hit_soft_17, blackjack payout index, double_after_split, offset (in doubles)
+
+#Card values are stored as 1..10 (ace = 1, all tens share one slot). Two-card hands are unordered, so (a, b) with a <= b gives 55 pairs.
+VALUES = range(1, 11)
+PAIRS = [(a, b) for a in VALUES for b in VALUES if a <= b]
+PAIR_INDEX = {pair: i for i, pair in enumerate(PAIRS)}
+
+_tables = None
+
+
+def _value(rank: str) -> int:
+    v = card_value(rank)
+    return 1 if v == 11 else v
+
+def _variant_key(rules: Rules) -> tuple:
+    return (rules.decks, rules.hit_soft_17, BLACKJACK_PAYOUTS.index(rules.blackjack_payout), rules.double_after_split)
+
+# ---------------------------------------
+# Table construction
+# ---------------------------------------
+
+def _initial_counts(decks: int) -> tuple:
+    return tuple(16 * decks if v == 10 else 4 * decks for v in VALUES)
+
+def _remove(counts: tuple, v: int) -> tuple:
+    return counts[:v - 1] + (counts[v - 1] - 1,) + counts[v:]
+
+#Probabilities of the dealer finishing on (17, 18, 19, 20, 21, bust), drawing from `counts`. Mirrors the draw rule in dealer_play().
+@lru_cache(maxsize=None)
+def _dealer_dist(counts: tuple, total: int, has_ace: bool, hit_soft_17: bool) -> tuple:
+    best = total + 10 if has_ace and total + 10 <= 21 else total
+    if best > 21:
+        return (0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+    is_soft_17 = has_ace and total + 10 == 17
+    if best >= 17 and not (is_soft_17 and hit_soft_17):
+        dist = [0.0] * 6
+        dist[best - 17] = 1.0
+        return tuple(dist)
+
+    n = sum(counts)
+    dist = [0.0] * 6
+    for v in VALUES:
+        c = counts[v - 1]
+        if not c:
+            continue
+        sub = _dealer_dist(_remove(counts, v), total + v, has_ace or v == 1, hit_soft_17)
+        p = c / n
+        for i in range(6):
+            dist[i] += p * sub[i]
+    return tuple(dist)
+
+#Dealer outcome distribution given the upcard, with the hole card conditioned on the dealer not having blackjack.
+@lru_cache(maxsize=None)
+def _dealer_after_peek(counts: tuple, upcard: int, hit_soft_17: bool) -> tuple:
+    excluded = 10 if upcard == 1 else 1 if upcard == 10 else None
+    n = sum(counts) - (counts[excluded - 1] if excluded else 0)
+    dist = [0.0] * 6
+    for v in VALUES:
+        c = counts[v - 1]
+        if not c or v == excluded:
+            continue
+        sub = _dealer_dist(_remove(counts, v), upcard + v, upcard == 1 or v == 1, hit_soft_17)
+        p = c / n
+        for i in range(6):
+            dist[i] += p * sub[i]
+    return tuple(dist)
+
+def _stand_ev(counts: tuple, player_best: int, upcard: int, hit_soft_17: bool) -> float:
+    dist = _dealer_after_peek(counts, upcard, hit_soft_17)
+    ev = dist[5]
+    for i, d in enumerate(range(17, 22)):
+        if player_best > d:
+            ev += dist[i]
+        elif player_best < d:
+            ev -= dist[i]
+    return ev
+
+#EV of taking one more card and then playing on optimally (hit or stand). Player draws ignore the unseen hole card, the usual
+#approximation for composition-dependent tables.
+@lru_cache(maxsize=None)
+def _hit_ev(counts: tuple, total: int, has_ace: bool, upcard: int, hit_soft_17: bool) -> float:
+    n = sum(counts)
+    ev = 0.0
+    for v in VALUES:
+        c = counts[v - 1]
+        if not c:
+            continue
+        p = c / n
+        new_total = total + v
+        if new_total > 21:
+            ev -= p
+            continue
+        rest = _remove(counts, v)
+        ace = has_ace or v == 1
+        best = new_total + 10 if ace and new_total + 10 <= 21 else new_total
+        outcome = _stand_ev(rest, best, upcard, hit_soft_17)
+        if best < 21:
+            outcome = max(outcome, _hit_ev(rest, new_total, ace, upcard, hit_soft_17))
+        ev += p * outcome
+    return ev
+
+def _double_ev(counts: tuple, total: int, has_ace: bool, upcard: int, hit_soft_17: bool) -> float:
+    n = sum(counts)
+    ev = 0.0
+    for v in VALUES:
+        c = counts[v - 1]
+        if not c:
+            continue
+        p = c / n
+        new_total = total + v
+        if new_total > 21:
+            ev -= p
+            continue
+        best = new_total + 10 if (has_ace or v == 1) and new_total + 10 <= 21 else new_total
+        ev += p * _stand_ev(_remove(counts, v), best, upcard, hit_soft_17)
+    return 2 * ev
+
+#EV of splitting a pair of `v`, for both hands together. Each hand takes one card and is then stood, hit or doubled, whichever is best.
+def _split_ev(counts: tuple, v: int, upcard: int, hit_soft_17: bool, double_after_split: bool) -> float:
+    n = sum(counts)
+    ev = 0.0
+    for w in VALUES:
+        c = counts[w - 1]
+        if not c:
+            continue
+        rest = _remove(counts, w)
+        total = v + w
+        ace = v == 1 or w == 1
+        best = total + 10 if ace and total + 10 <= 21 else total  # 21 after a split is not a blackjack
+        outcome = max(_stand_ev(rest, best, upcard, hit_soft_17), _hit_ev(rest, total, ace, upcard, hit_soft_17))
+        if double_after_split:
+            outcome = max(outcome, _double_ev(rest, total, ace, upcard, hit_soft_17))
+        ev += c / n * outcome
+    return 2 * ev
+
+def _variant_values(decks: int, hit_soft_17: bool, blackjack_ev: float, double_after_split: bool) -> array:
+    values = array("d")
+    full = _initial_counts(decks)
+    for a, b in PAIRS:
+        for upcard in VALUES:
+            counts = _remove(_remove(_remove(full, a), b), upcard)
+            total = a + b
+            has_ace = a == 1 or b == 1
+            if has_ace and total == 11:
+                values.extend((blackjack_ev,) * len(ACTIONS))  # blackjack is paid before any action
+                continue
+            best = total + 10 if has_ace else total
+            values.append(_stand_ev(counts, best, upcard, hit_soft_17))
+            values.append(_hit_ev(counts, total, has_ace, upcard, hit_soft_17))
+            values.append(_double_ev(counts, total, has_ace, upcard, hit_soft_17))
+            values.append(_split_ev(counts, a, upcard, hit_soft_17, double_after_split) if a == b else math.nan)
+            values.append(-0.5)
+    return values
+
+#Computes the table for each rule set in `variants` and writes the table file. The file is written next to the target and renamed into
+#place, so workers that already mapped the old file keep a consistent view.
+def build_tables(path: Path | str = DEFAULT_PATH, variants=VARIANTS) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    data = array("d")
+    entries = []
+    keys = sorted({_variant_key(rules) for rules in variants})
+    for i, (decks, hit_soft_17, payout, double_after_split) in enumerate(keys):
+        num, den = BLACKJACK_PAYOUTS[payout]
+        entries.append(_VARIANT.pack(decks, hit_soft_17, payout, double_after_split, len(data)))
+        data.extend(_variant_values(decks, hit_soft_17, num / den, double_after_split))
+        if i + 1 == len(keys) or keys[i + 1][:2] != (decks, hit_soft_17):  # payouts and DAS share the dealer/hit caches
+            for fn in (_dealer_dist, _dealer_after_peek, _hit_ev):
+                fn.cache_clear()
+
+    header = _HEADER.pack(MAGIC, VERSION, sys.byteorder == "little", len(entries), len(PAIRS), len(VALUES))
+    prefix = header + b"".join(entries)
+    prefix += b"\0" * (-len(prefix) % 8)  # keep the doubles 8-byte aligned
+
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(prefix)
+        data.tofile(f)
+    os.replace(tmp, path)
+    return path
+
+# ---------------------------------------
+# Lookups
+# ---------------------------------------
+
+class OutcomeTables:
+    def __init__(self, path: Path | str = DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, little, n_variants, n_pairs, n_upcards = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or n_pairs != len(PAIRS) or n_upcards != len(VALUES):
+            raise ValueError(f"{path} is not a compatible outcome table file; rebuild it.")
+        if bool(little) != (sys.byteorder == "little"):
+            raise ValueError(f"{path} was built on a machine with a different byte order; rebuild it.")
+
+        self.offsets = {}
+        pos = _HEADER.size
+        for _ in range(n_variants):
+            decks, hit_soft_17, payout, double_after_split, offset = _VARIANT.unpack_from(self._mm, pos)
+            self.offsets[(decks, bool(hit_soft_17), payout, bool(double_after_split))] = offset
+            pos += _VARIANT.size
+        pos += -pos % 8
+        self._view = memoryview(self._mm)[pos:]
+        self.values = self._view.cast("d")
+
+    def close(self):
+        self.values.release()
+        self._view.release()
+        self._mm.close()
+
+    def ev(self, player_values: tuple, upcard: int, action: int, rules: Rules = DEFAULT_RULES) -> float:
+        a, b = player_values
+        pair = PAIR_INDEX[(a, b) if a <= b else (b, a)]
+        try:
+            base = self.offsets[_variant_key(rules)]
+        except KeyError:
+            raise KeyError(f"No outcome table for {rules}; add it to GAME_RULES or VARIANTS and rebuild.") from None
+        return self.values[base + (pair * len(VALUES) + upcard - 1) * len(ACTIONS) + action]
+
+#Maps the default table file on first use. Nothing is computed here; a missing file means the build step was not run.
+def get_tables() -> OutcomeTables:
+    global _tables
+    if _tables is None:
+        try:
+            _tables = OutcomeTables(DEFAULT_PATH)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{DEFAULT_PATH} not found. Run 'python manage.py build_outcome_tables' first.") from None
+    return _tables
+
+#Actions `rules` allow on a two-card hand. Splitting needs two cards of the same rank (a ten and a king are not a pair).
+def _legal_actions(player_cards, rules: Rules) -> tuple:
+    actions = ("stand", "hit", "double")
+    if rules.max_splits and player_cards[0].rank == player_cards[1].rank:
+        actions += ("split",)
+    if rules.surrender:
+        actions += ("surrender",)
+    return actions
+
+#EV of `action` (one of ACTIONS) for a two-card player hand against the dealer upcard under `rules`.
+def action_ev(player_cards, upcard, action: str, rules: Rules = DEFAULT_RULES) -> float:
+    if action not in _legal_actions(player_cards, rules):
+        raise ValueError(f"{action} is not allowed on this hand under {rules}.")
+    values = tuple(_value(c.rank) for c in player_cards)
+    return get_tables().ev(values, _value(upcard.rank), ACTIONS.index(action), rules)
+
+#Rules are hashable, so the chosen action is cached per (hand, upcard, rules, legal actions).
+@lru_cache(maxsize=None)
+def _best_action(player_values: tuple, upcard: int, rules: Rules, actions: tuple) -> str:
+    tables = get_tables()
+    return max(actions, key=lambda a: tables.ev(player_values, upcard, ACTIONS.index(a), rules))
+
+#Highest-EV legal action for a two-card player hand against the dealer upcard under `rules`.
+def best_action(player_cards, upcard, rules: Rules = DEFAULT_RULES) -> str:
+    a, b = (_value(c.rank) for c in player_cards)
+    return _best_action((a, b) if a <= b else (b, a), _value(upcard.rank), rules, _legal_actions(player_cards, rules))
@@ -0,0 +1,364 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from .logic import BLACKJACK_PAYOUTS, RANKS, SUITS, Card, Deck, GameState, Hand, Rules
+
+#Game-state store used by the views instead of pickling GameState into the session table. Players are spread over a fixed number of
+#shard files by a hash of their key. Every save appends one fixed-size record to the player's shard, so writers only ever lock one
+#shard (never the whole store) and a record is always written with a single os.write(). The newest record for a key wins; compact()
+#drops the superseded ones, and a shard compacts itself on write once most of it is dead records. The first record slot of every shard
+#is a header with MAGIC/VERSION, so a shard written with a different record layout is rejected instead of being decoded as garbage. The
+#header also carries a generation number that compact() bumps, which tells other processes their index of the shard is stale.
+
+MAGIC = b"BJGS"
+VERSION = 2  # 1: user-027 layout without rules or per-hand bets (no header)
+_SHARD_HEADER = struct.Struct("<4sH2xI")  # magic, version, generation
+
+RECORD_SIZE = 1024
+REFRESH_CHUNK = 256  # records read per pread when indexing a shard (256 KiB)
+#A shard is compacted on write once it holds at least COMPACT_AFTER superseded records and they make up COMPACT_DEAD_RATIO of it.
+COMPACT_AFTER = 4096
+COMPACT_DEAD_RATIO = 0.5
+_RECORD = struct.Struct("<16sH")  # key digest, payload length (0 = deleted)
+PAYLOAD_SIZE = RECORD_SIZE - _RECORD.size
+
+STATUSES = ["waiting_for_bet", "playing", "split_playing", "player_bust", "dealer_bust", "insurance_offered"]
+_STATE = struct.Struct("<iiBBHHBBBB")  # bankroll, bet, status, active hand, deck, message, dealer, player, hands, player is hands[active]
+_RULES = struct.Struct("<BBBB")  # decks, blackjack payout, resplit limit, flags
+_FLAGS = ("hit_soft_17", "double_after_split", "surrender", "insurance")
+
+# ---------------------------------------
+# Compact GameState encoding (one byte per card)
+# ---------------------------------------
+
+def _encode_cards(cards) -> bytes:
+    return bytes(RANKS.index(c.rank) * 4 + SUITS.index(c.suit) for c in cards)
+
+def _decode_cards(data) -> list:
+    return [Card(RANKS[b // 4], SUITS[b % 4]) for b in data]
+
+def _encode_rules(rules: Rules) -> bytes:
+    flags = sum(1 << i for i, name in enumerate(_FLAGS) if getattr(rules, name))
+    return _RULES.pack(rules.decks, BLACKJACK_PAYOUTS.index(rules.blackjack_payout), rules.max_splits, flags)
+
+def _decode_rules(data) -> Rules:
+    decks, payout, max_splits, flags = _RULES.unpack_from(data, 0)
+    options = {name: bool(flags & (1 << i)) for i, name in enumerate(_FLAGS)}
+    return Rules(decks=decks, blackjack_payout=BLACKJACK_PAYOUTS[payout], max_splits=max_splits, **options)
+
+def encode_state(state: GameState) -> bytes:
+    hands = state.hands
+    player_is_active = bool(hands) and state.active_hand_index < len(hands) and state.player is hands[state.active_hand_index]
+    cards = _encode_cards(state.deck.cards) + _encode_cards(state.dealer.cards)
+    if not player_is_active:
+        cards += _encode_cards(state.player.cards)
+    for h in hands:
+        cards += _encode_cards(h.cards)
+
+    #The message is display-only, so it is the one field trimmed to fit the record.
+    room = PAYLOAD_SIZE - _STATE.size - _RULES.size - 4 * len(hands) - len(cards)
+    if room < 0:
+        raise ValueError("Game state is too large for a store record.")
+    message = state.message.encode("utf-8")[:room].decode("utf-8", "ignore").encode("utf-8")
+
+    header = _STATE.pack(
+        state.bankroll,
+        state.current_bet,
+        STATUSES.index(state.status),
+        state.active_hand_index,
+        len(state.deck.cards),
+        len(message),
+        len(state.dealer.cards),
+        0 if player_is_active else len(state.player.cards),
+        len(hands),
+        player_is_active,
+    )
+    hand_info = bytes(len(h.cards) for h in hands) + struct.pack(f"<{len(hands)}i", *state.hand_bets)
+    return header + _encode_rules(state.rules) + hand_info + cards + message
+
+def decode_state(data: bytes) -> GameState:
+    bankroll, bet, status, active, n_deck, n_message, n_dealer, n_player, n_hands, player_is_active = _STATE.unpack_from(data, 0)
+    pos = _STATE.size
+    rules = _decode_rules(data[pos:pos + _RULES.size])
+    pos += _RULES.size
+    hand_sizes = data[pos:pos + n_hands]
+    pos += n_hands
+    hand_bets = list(struct.unpack_from(f"<{n_hands}i", data, pos))
+    pos += 4 * n_hands
+
+    def take(n):
+        nonlocal pos
+        chunk = data[pos:pos + n]
+        pos += n
+        return chunk
+
+    deck = Deck(_decode_cards(take(n_deck)), rules.decks)  # an empty deck is rebuilt, as Deck.draw() would do anyway
+    dealer = Hand(_decode_cards(take(n_dealer)))
+    player = Hand(_decode_cards(take(n_player)))
+    hands = [Hand(_decode_cards(take(n))) for n in hand_sizes]
+    if player_is_active:
+        player = hands[active]
+
+    return GameState(
+        deck=deck,
+        player=player,
+        dealer=dealer,
+        status=STATUSES[status],
+        message=take(n_message).decode("utf-8"),
+        bankroll=bankroll,
+        current_bet=bet,
+        hands=hands,
+        active_hand_index=active,
+        rules=rules,
+        hand_bets=hand_bets,
+    )
+
+# ---------------------------------------
+# Sharded append-only store
+# ---------------------------------------
+
+#File locking and positional reads work on both POSIX and Windows. Windows has no shared locks, so readers take the exclusive lock
+#there. msvcrt locks are mandatory, so they go on a byte far past any record instead of on data other processes need to read.
+if os.name == "nt":
+    import msvcrt
+
+    _LOCK_OFFSET = 1 << 30
+
+    def _lock_file(fd: int, exclusive: bool):
+        os.lseek(fd, _LOCK_OFFSET, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK gives up after ~10 seconds
+                time.sleep(0.01)
+
+    def _unlock_file(fd: int):
+        os.lseek(fd, _LOCK_OFFSET, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(fd: int, exclusive: bool):
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _unlock_file(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+def _read_at(fd: int, size: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+def _header(generation: int) -> bytes:
+    return _SHARD_HEADER.pack(MAGIC, VERSION, generation).ljust(RECORD_SIZE, b"\0")
+
+
+class _Shard:
+    def __init__(self, path: Path):
+        self.path = path
+        self.backup = path.with_suffix(".compact")
+        self.lock = threading.Lock()  # file locks do not exclude threads sharing one fd
+        self.fd = None
+        self.generation = None
+        self.index = {}  # key digest -> record number of its newest record
+        self.scanned = 1  # record 0 is the shard header
+
+    def _reset(self, generation):
+        self.generation = generation
+        self.index = {}
+        self.scanned = 1
+
+    #Reads the header and drops our index if compact() has rewritten the shard since we last looked.
+    def _check_header(self):
+        header = _read_at(self.fd, _SHARD_HEADER.size, 0)
+        if not header:
+            generation = 0  # empty shard; append() writes the header with the first record
+        else:
+            magic, version, generation = _SHARD_HEADER.unpack(header.ljust(_SHARD_HEADER.size, b"\0"))
+            if (magic, version) != (MAGIC, VERSION):
+                raise ValueError(f"{self.path} is not a version {VERSION} game-state shard; delete it or migrate it.")
+        if generation != self.generation:
+            self._reset(generation)
+
+    #A leftover backup means a compaction died half way; put the shard back from it. Needs the exclusive lock.
+    def _recover(self):
+        if self.backup.exists():
+            data = self.backup.read_bytes()
+            os.ftruncate(self.fd, 0)
+            os.write(self.fd, data)
+            os.fsync(self.fd)
+            os.remove(self.backup)
+
+    def acquire(self, exclusive: bool):
+        self.lock.acquire()
+        try:
+            if self.fd is None:
+                flags = os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+                self.fd = os.open(self.path, flags, 0o600)
+            _lock_file(self.fd, exclusive or self.backup.exists())
+            try:
+                self._recover()
+                self._check_header()
+            except BaseException:
+                _unlock_file(self.fd)
+                raise
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def release(self):
+        _unlock_file(self.fd)
+        self.lock.release()
+
+    #Indexes records appended (by any process) since the last scan, REFRESH_CHUNK records at a time.
+    def refresh(self):
+        total = os.fstat(self.fd).st_size // RECORD_SIZE
+        while self.scanned < total:
+            count = min(REFRESH_CHUNK, total - self.scanned)
+            data = _read_at(self.fd, count * RECORD_SIZE, self.scanned * RECORD_SIZE)
+            for i in range(count):
+                self.index[data[i * RECORD_SIZE:i * RECORD_SIZE + 16]] = self.scanned + i
+            self.scanned += count
+
+    def read_record(self, n: int) -> bytes:
+        return _read_at(self.fd, RECORD_SIZE, n * RECORD_SIZE)
+
+    def read(self, digest: bytes) -> bytes | None:
+        n = self.index.get(digest)
+        if n is None:
+            return None
+        record = self.read_record(n)
+        _, length = _RECORD.unpack_from(record, 0)
+        return record[_RECORD.size:_RECORD.size + length] if length else None
+
+    def append(self, digest: bytes, payload: bytes):
+        if os.fstat(self.fd).st_size == 0:
+            os.write(self.fd, _header(self.generation))
+        record = _RECORD.pack(digest, len(payload)) + payload
+        os.write(self.fd, record.ljust(RECORD_SIZE, b"\0"))
+        self.refresh()
+
+    #Rewrites the shard in place (Windows cannot replace a file other workers hold open). The new contents go to a backup file first,
+    #so a crash part way through is repaired by _recover() on the next exclusive lock.
+    def rewrite(self, records: list):
+        data = _header(self.generation + 1) + b"".join(records)
+        with open(self.backup, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.ftruncate(self.fd, 0)
+        os.write(self.fd, data)
+        os.fsync(self.fd)
+        os.remove(self.backup)
+        self._reset(self.generation + 1)
+
+    #Records superseded by a newer record for the same key. A deleted key keeps one record until the next compaction.
+    def dead_records(self) -> int:
+        return self.scanned - 1 - len(self.index)  # scanned counts the header slot
+
+    #Rewrites the shard with only the newest record per live key. Needs the exclusive lock. Returns the number of records dropped.
+    def compact(self) -> int:
+        self.refresh()
+        live = []
+        for n in sorted(self.index.values()):
+            record = self.read_record(n)
+            if _RECORD.unpack_from(record, 0)[1]:
+                live.append(record)
+        dropped = self.scanned - 1 - len(live)
+        if dropped:
+            self.rewrite(live)
+        return dropped
+
+
+class GameStateStore:
+    #compact_after is the dead-record count from which a shard compacts itself on write (None turns that off).
+    def __init__(self, directory: Path | str, shards: int = 16, compact_after: int | None = COMPACT_AFTER):
+        self.directory = Path(directory)
+        self._shards = [_Shard(self.directory / f"shard-{i:02d}.log") for i in range(shards)]
+        self._dir_ready = False
+        self.compact_after = compact_after
+
+    def _shard(self, key: str) -> tuple:
+        if not self._dir_ready:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._dir_ready = True
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        return self._shards[digest[0] % len(self._shards)], digest
+
+    #Called after a write, with the shard's exclusive lock held. Compacting only once dead records are a fixed share of the shard keeps
+    #the cost amortized to a constant per write.
+    def _maybe_compact(self, shard: _Shard):
+        if self.compact_after is None:
+            return
+        dead = shard.dead_records()
+        if dead >= self.compact_after and dead >= COMPACT_DEAD_RATIO * (shard.scanned - 1):
+            shard.compact()
+
+    def load(self, key: str) -> GameState | None:
+        shard, digest = self._shard(key)
+        shard.acquire(exclusive=False)
+        try:
+            shard.refresh()
+            payload = shard.read(digest)
+        finally:
+            shard.release()
+        return decode_state(payload) if payload else None
+
+    def save(self, key: str, state: GameState):
+        payload = encode_state(state)
+        shard, digest = self._shard(key)
+        shard.acquire(exclusive=True)
+        try:
+            shard.append(digest, payload)
+            self._maybe_compact(shard)
+        finally:
+            shard.release()
+
+    #Read-modify-write for one player: fn gets the current state (None if there is none) and its result is saved, all while holding
+    #the shard's exclusive lock. If fn returns None nothing is written. Returns fn's result.
+    def update(self, key: str, fn) -> GameState | None:
+        shard, digest = self._shard(key)
+        shard.acquire(exclusive=True)
+        try:
+            shard.refresh()
+            payload = shard.read(digest)
+            state = fn(decode_state(payload) if payload else None)
+            if state is not None:
+                shard.append(digest, encode_state(state))
+                self._maybe_compact(shard)
+        finally:
+            shard.release()
+        return state
+
+    def delete(self, key: str):
+        shard, digest = self._shard(key)
+        shard.acquire(exclusive=True)
+        try:
+            shard.refresh()
+            if digest in shard.index:
+                shard.append(digest, b"")
+                self._maybe_compact(shard)
+        finally:
+            shard.release()
+
+    #Rewrites each shard with only the newest record per live key. Shards are compacted one at a time, so only that shard's
+    #players wait. Returns the number of records dropped.
+    def compact(self) -> int:
+        if not self.directory.exists():
+            return 0
+        dropped = 0
+        for shard in self._shards:
+            if not shard.path.exists():
+                continue
+            shard.acquire(exclusive=True)
+            try:
+                dropped += shard.compact()
+            finally:
+                shard.release()
+        return dropped
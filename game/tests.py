@@ -1,3 +1,410 @@
+import math
+import os
+import tempfile
+from collections import Counter
+from unittest import mock, skipUnless
+
+from django.contrib.sessions.models import Session
 from django.test import TestCase
 
-# Create your tests here.
+from . import logic
+from .logic import (
+    RANKS,
+    SUITS,
+    Card,
+    Deck,
+    GameState,
+    Hand,
+    Rules,
+    ShoePool,
+    configure_shoe_pools,
+    get_shoe_pool,
+    place_bet,
+    player_double_down,
+    player_insurance,
+    player_split,
+    player_stand,
+    player_surrender,
+    start_game,
+)
+from .state_store import GameStateStore, decode_state, encode_state
+from . import fast_engine, outcome_tables, state_store, verify, views
+
+
+#Builds a Deck-ready card list that deals `cards` in the given order (Deck.draw() pops from the end).
+def deal_order(*cards):
+    return [Card(rank, "♠") for rank in reversed(cards)]
+
+
+class OutcomeTablesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = outcome_tables.build_tables(f"{cls.tmp.name}/tables.bin", variants=(Rules(),))
+        cls.tables = outcome_tables.OutcomeTables(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tables.close()
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def test_header(self):
+        magic, version, _, variants, pairs, upcards = outcome_tables._HEADER.unpack_from(self.path.read_bytes(), 0)
+        self.assertEqual((magic, version), (outcome_tables.MAGIC, outcome_tables.VERSION))
+        self.assertEqual((variants, pairs, upcards), (1, 55, 10))
+        self.assertEqual(list(self.tables.offsets), [(1, False, 0, True)])
+
+    def test_known_cells(self):
+        stand, hit, double = (outcome_tables.ACTIONS.index(a) for a in ("stand", "hit", "double"))
+        self.assertAlmostEqual(self.tables.ev((10, 10), 6, stand), 0.70, delta=0.01)
+        self.assertGreater(self.tables.ev((5, 6), 6, double), self.tables.ev((5, 6), 6, hit))
+        self.assertEqual(self.tables.ev((1, 10), 5, stand), 1.5)
+        self.assertEqual(self.tables.ev((10, 1), 5, hit), 1.5)
+
+    def test_split_and_surrender_cells(self):
+        split, surrender = (outcome_tables.ACTIONS.index(a) for a in ("split", "surrender"))
+        best_other = lambda pair, upcard: max(self.tables.ev(pair, upcard, i) for i in range(3))
+        self.assertGreater(self.tables.ev((8, 8), 10, split), best_other((8, 8), 10))
+        self.assertGreater(self.tables.ev((1, 1), 6, split), best_other((1, 1), 6))
+        self.assertLess(self.tables.ev((10, 10), 6, split), best_other((10, 10), 6))
+        self.assertTrue(math.isnan(self.tables.ev((5, 6), 6, split)))
+        self.assertEqual(self.tables.ev((10, 6), 10, surrender), -0.5)
+
+    def test_best_action_only_picks_legal_actions(self):
+        self.addCleanup(outcome_tables._best_action.cache_clear)
+        eights = [Card("8", "♠"), Card("8", "♥")]
+        with mock.patch.object(outcome_tables, "_tables", self.tables):
+            self.assertEqual(outcome_tables.best_action(eights, Card("K", "♠")), "split")
+            self.assertNotEqual(outcome_tables.best_action(eights, Card("K", "♠"), Rules(max_splits=0)), "split")
+            self.assertEqual(outcome_tables.best_action([Card("K", "♠"), Card("Q", "♠")], Card("6", "♠")), "stand")
+            with self.assertRaises(ValueError):
+                outcome_tables.action_ev([Card("10", "♠"), Card("6", "♠")], Card("K", "♠"), "surrender")
+
+    def test_missing_variant(self):
+        with self.assertRaises(KeyError):
+            self.tables.ev((10, 10), 6, 0, Rules(decks=6))
+
+    def test_rejects_incompatible_file(self):
+        bad = self.path.with_name("bad.bin")
+        bad.write_bytes(b"NOPE" + self.path.read_bytes()[4:])
+        with self.assertRaisesRegex(ValueError, "not a compatible outcome table file"):
+            outcome_tables.OutcomeTables(bad)
+
+
+class StateStoreTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = GameStateStore(self.tmp.name, shards=2)
+
+    def test_encode_decode_round_trip(self):
+        state = GameState(rules=Rules(decks=2, hit_soft_17=True, blackjack_payout=(6, 5), surrender=True, max_splits=2), bankroll=500)
+        state.deck.cards = state.deck.cards[:80] + deal_order("8", "9", "8", "4", "3", "5")
+        state = start_game(place_bet(state, 20))
+        state = player_split(state)
+
+        decoded = decode_state(encode_state(state))
+        self.assertEqual(decoded.rules, state.rules)
+        self.assertEqual(decoded.bankroll, state.bankroll)
+        self.assertEqual(decoded.status, "split_playing")
+        self.assertEqual(decoded.hand_bets, [20, 20])
+        self.assertEqual([h.cards for h in decoded.hands], [h.cards for h in state.hands])
+        self.assertIs(decoded.player, decoded.hands[decoded.active_hand_index])
+        self.assertEqual(decoded.dealer.cards, state.dealer.cards)
+        self.assertEqual(decoded.deck.cards, state.deck.cards)
+        self.assertEqual(decoded.message, state.message)
+
+    def test_load_save_delete(self):
+        self.assertIsNone(self.store.load("player"))
+        self.store.save("player", GameState(bankroll=750))
+        self.assertEqual(self.store.load("player").bankroll, 750)
+        self.store.save("player", GameState(bankroll=600))
+        self.assertEqual(self.store.load("player").bankroll, 600)
+        self.store.delete("player")
+        self.assertIsNone(self.store.load("player"))
+
+    def test_update_saves_the_result_and_skips_none(self):
+        self.assertIsNone(self.store.update("player", lambda state: None))
+        self.assertIsNone(self.store.load("player"))
+        self.store.update("player", lambda state: state or GameState(bankroll=300))
+        self.store.update("player", lambda state: place_bet(state, 100))
+        self.assertEqual(self.store.load("player").bankroll, 200)
+
+    def test_compact_drops_superseded_and_deleted_records(self):
+        for bankroll in (100, 200, 300):
+            self.store.save("kept", GameState(bankroll=bankroll))
+        self.store.save("gone", GameState())
+        self.store.delete("gone")
+
+        self.assertEqual(self.store.compact(), 4)  # two superseded saves, the deleted save and its tombstone
+        self.assertEqual(self.store.compact(), 0)
+        self.assertEqual(self.store.load("kept").bankroll, 300)
+        self.assertIsNone(self.store.load("gone"))
+
+        #Another store instance (as in another worker) still sees the compacted data.
+        self.assertEqual(GameStateStore(self.tmp.name, shards=2).load("kept").bankroll, 300)
+
+    def test_shard_compacts_itself_once_mostly_dead(self):
+        store = GameStateStore(self.tmp.name, shards=1, compact_after=4)
+        store.save("other", GameState(bankroll=50))
+        for bankroll in range(1, 11):
+            store.save("player", GameState(bankroll=bankroll))
+        shard = store._shards[0]
+        self.assertGreater(shard.generation, 0)
+        self.assertLess(shard.path.stat().st_size, 8 * state_store.RECORD_SIZE)
+        self.assertEqual(store.load("player").bankroll, 10)
+        self.assertEqual(store.load("other").bankroll, 50)
+
+    def test_refresh_reads_in_chunks(self):
+        for i in range(10):
+            self.store.save(f"player-{i}", GameState(bankroll=i))
+        with mock.patch.object(state_store, "REFRESH_CHUNK", 3):
+            other = GameStateStore(self.tmp.name, shards=2)
+            self.assertEqual([other.load(f"player-{i}").bankroll for i in range(10)], list(range(10)))
+
+    def test_rejects_shard_with_unknown_layout(self):
+        self.store.save("player", GameState())
+        for shard in self.store._shards:
+            if shard.path.exists():
+                shard.path.write_bytes(b"\0" * 2048)
+        with self.assertRaises(ValueError):
+            GameStateStore(self.tmp.name, shards=2).load("player")
+
+
+#A round in progress with the player holding `player` against `dealer`, bet already placed; `draws` are the next cards in deal order.
+def round_state(player, dealer, draws=(), bet=10, bankroll=1000, **rules):
+    state = GameState(rules=Rules(**rules), bankroll=bankroll - bet, current_bet=bet, status="playing")
+    state.player = Hand([Card(rank, "♠") for rank in player])
+    state.dealer = Hand([Card(rank, "♥") for rank in dealer])
+    state.deck.cards = deal_order(*draws)
+    return state
+
+
+class RulesTests(TestCase):
+    def test_blackjack_return(self):
+        self.assertEqual(Rules().blackjack_return(10), 25)
+        self.assertEqual(Rules().blackjack_return(15), int(15 * 2.5))
+        self.assertEqual(Rules(blackjack_payout=(6, 5)).blackjack_return(10), 22)
+        with self.assertRaises(ValueError):
+            Rules(blackjack_payout=(2, 1))
+
+    def test_resplit_limit_is_bounded(self):
+        Rules(max_splits=3)
+        for limit in (-1, 4, 256):
+            with self.assertRaises(ValueError):
+                Rules(max_splits=limit)
+
+    def test_rules_are_cache_keys(self):
+        self.assertEqual(hash(Rules(decks=6, hit_soft_17=True)), hash(Rules(decks=6, hit_soft_17=True)))
+        self.assertNotEqual(Rules(), Rules(hit_soft_17=True))
+
+    def test_six_to_five_blackjack_payout(self):
+        state = GameState(rules=Rules(blackjack_payout=(6, 5)))
+        state.deck.cards = deal_order("A", "9", "K", "7")
+        state = start_game(place_bet(state, 10))
+        self.assertEqual(state.bankroll, 1012)
+
+    def test_split_hands_are_settled_with_their_own_bets(self):
+        #8,8 vs dealer 10,7: hand 1 gets 3 and doubles onto a 10 (21), hand 2 gets 10 (18). Dealer stands on 17.
+        state = round_state(["8", "8"], ["10", "7"], ["3", "10", "10"])
+        state = player_split(state)
+        self.assertEqual(state.hand_bets, [10, 10])
+        self.assertEqual(state.bankroll, 980)
+
+        state = player_double_down(state)
+        self.assertEqual(state.hand_bets, [20, 10])
+        state = player_stand(state)
+        self.assertEqual(state.status, "waiting_for_bet")
+        self.assertEqual(state.bankroll, 970 + 40 + 20)
+
+    def test_resplit_up_to_the_limit(self):
+        state = round_state(["8", "8"], ["10", "7"], ["8", "2", "3", "4"], max_splits=2)
+        state = player_split(state)
+        state = player_split(state)
+        self.assertEqual(len(state.hands), 3)
+        self.assertEqual(state.hand_bets, [10, 10, 10])
+        self.assertEqual(state.bankroll, 970)
+
+        state.hands[0].cards[1] = Card("8", "♦")  # make the active hand a pair again
+        state = player_split(state)
+        self.assertEqual(state.message, "No more splits allowed.")
+        self.assertEqual(len(state.hands), 3)
+
+    def test_no_resplit_by_default(self):
+        state = round_state(["8", "8"], ["10", "7"], ["8", "2"])
+        state = player_split(state)
+        state = player_split(state)
+        self.assertEqual(state.message, "No more splits allowed.")
+        self.assertEqual(len(state.hands), 2)
+
+    def test_double_after_split_refused_when_disabled(self):
+        state = round_state(["8", "8"], ["10", "7"], ["3", "2"], double_after_split=False)
+        state = player_split(state)
+        state = player_double_down(state)
+        self.assertEqual(state.message, "Doubling after a split is not allowed.")
+        self.assertEqual(state.hand_bets, [10, 10])
+        self.assertEqual(state.bankroll, 980)
+
+    def test_surrender_refunds_half_the_bet(self):
+        state = round_state(["10", "6"], ["10", "7"], surrender=True)
+        state = player_surrender(state)
+        self.assertEqual(state.status, "waiting_for_bet")
+        self.assertEqual(state.bankroll, 995)
+
+    def test_surrender_refused_when_disabled(self):
+        state = round_state(["10", "6"], ["10", "7"])
+        state = player_surrender(state)
+        self.assertEqual(state.status, "playing")
+        self.assertEqual(state.bankroll, 990)
+
+
+class InsuranceTests(TestCase):
+    def test_insurance_pays_two_to_one(self):
+        state = GameState(rules=Rules(insurance=True))
+        state.deck.cards = deal_order("10", "A", "9", "K")
+        state = start_game(place_bet(state, 10))
+        state = player_insurance(state, True)
+        #Main bet lost to the dealer blackjack; the 5 insurance bet returns 15.
+        self.assertEqual(state.status, "waiting_for_bet")
+        self.assertEqual(state.bankroll, 1000 - 10 - 5 + 15)
+
+    def test_declined_insurance_continues_the_round(self):
+        state = GameState(rules=Rules(insurance=True))
+        state.deck.cards = deal_order("10", "A", "9", "6")
+        state = start_game(place_bet(state, 10))
+        state = player_insurance(state, False)
+        self.assertEqual(state.status, "playing")
+        self.assertEqual(state.bankroll, 990)
+
+    def test_stand_is_ignored_while_insurance_is_offered(self):
+        state = GameState(rules=Rules(insurance=True))
+        state.deck.cards = deal_order("A", "A", "K", "9", "5")
+        state = start_game(place_bet(state, 10))
+        self.assertEqual(state.status, "insurance_offered")
+
+        state = player_stand(state)
+        self.assertEqual(state.status, "insurance_offered")
+        self.assertEqual(state.bankroll, 990)
+        self.assertEqual(len(state.dealer.cards), 2)
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(views, "STORE", GameStateStore(tmp.name, shards=2))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_actions_without_a_game_do_not_create_a_session(self):
+        self.assertEqual(self.client.post("/api/hit/").status_code, 400)
+        self.assertEqual(self.client.post("/api/new/").status_code, 400)
+        self.assertFalse(Session.objects.exists())
+
+    def test_bet_creates_the_session(self):
+        response = self.client.post("/api/bet/", {"amount": 10}, content_type="application/json")
+        self.assertEqual(response.json()["bankroll"], 990)
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertIsNotNone(views.STORE.load(self.client.session.session_key))
+
+
+class ShoePoolTests(TestCase):
+    def started_pool(self, decks=1, size=2):
+        pool = ShoePool(decks, size)
+        pool.start()
+        self.addCleanup(pool.stop)
+        return pool
+
+    def test_take_returns_a_shuffled_shoe(self):
+        pool = self.started_pool(decks=2)
+        shoe = pool.take()
+        self.assertEqual(len(shoe), 104)
+        self.assertEqual(Counter((c.rank, c.suit) for c in shoe), Counter({(rank, suit): 2 for suit in SUITS for rank in RANKS}))
+        self.assertNotEqual(shoe, [Card(rank, suit) for _ in range(2) for suit in SUITS for rank in RANKS])
+        self.assertEqual(pool.taken, 1)
+
+    def test_empty_pool_counts_a_starvation(self):
+        pool = ShoePool(1, 2)
+        with mock.patch.object(pool, "_fill"):  # filler never adds a shoe
+            pool.start()
+        self.addCleanup(pool.stop)
+        self.assertEqual(len(pool.take()), 52)
+        self.assertEqual((pool.taken, pool.starved), (1, 1))
+
+    def test_configure_shoe_pools(self):
+        self.addCleanup(configure_shoe_pools, logic.SHOE_POOL_SIZE)
+        with self.assertRaises(ValueError):
+            configure_shoe_pools(0)
+
+        old = get_shoe_pool(3)
+        old.start()
+        configure_shoe_pools(2)
+        new = get_shoe_pool(3)
+        self.assertIsNot(new, old)
+        self.assertEqual(new.size, 2)
+        old._thread.join(timeout=5)
+        self.assertFalse(old._thread.is_alive())
+
+    def test_deck_takes_a_fresh_shoe_when_empty(self):
+        deck = Deck(cards=deal_order("A"))
+        self.assertEqual(deck.draw(), Card("A", "♠"))
+        deck.draw()
+        self.assertEqual(len(deck.cards), 51)
+
+    @skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_filler_restarts_after_fork(self):
+        pool = self.started_pool()
+        pool.take()
+        pid = os.fork()
+        if pid == 0:
+            #Child: the parent's filler thread is gone and its counters must not carry over.
+            ok = False
+            try:
+                pool.take()
+                ok = pool._thread.is_alive() and (pool.taken, pool.starved) in ((1, 0), (1, 1))
+            finally:
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+
+class DifferentialHarnessTests(TestCase):
+    def test_fast_engine_matches_reference(self):
+        self.assertIsNone(verify.verify("int-cards", rounds=2000, workers=1))
+
+    def test_wrong_engine_is_shrunk_to_a_minimal_case(self):
+        #Overpays by 1 whenever an H17 dealer finishes on 18.
+        def wrong(shoe, bankroll, bet, actions, insurance, rules):
+            result = fast_engine.play_round(shoe, bankroll, bet, actions, insurance, rules)
+            if rules.hit_soft_17 and result[2] == 18:
+                return (result[0] + 1,) + result[1:]
+            return result
+
+        verify.ENGINES["wrong"] = wrong
+        self.addCleanup(verify.ENGINES.pop, "wrong")
+
+        seed = next(seed for seed in range(10000) if verify.check("wrong", verify.make_case(seed)))
+        case = verify.shrink("wrong", verify.make_case(seed))
+        self.assertIsNotNone(verify.check("wrong", case))
+        self.assertEqual(case.actions, ())
+        self.assertLessEqual(len(case.shoe), 5)
+        self.assertEqual(case.rules, Rules(hit_soft_17=True))
+
+    def test_engine_that_runs_out_of_cards_is_a_mismatch(self):
+        #Plays the round correctly, then keeps drawing until the shoe is empty.
+        def overdraw(shoe, bankroll, bet, actions, insurance, rules):
+            result = fast_engine.play_round(shoe, bankroll, bet, actions, insurance, rules)
+            while True:
+                fast_engine._draw(shoe)
+
+        verify.ENGINES["overdraw"] = overdraw
+        self.addCleanup(verify.ENGINES.pop, "overdraw")
+
+        case = verify.make_case(0)
+        expected, actual = verify.check("overdraw", case)
+        self.assertEqual(actual, "shoe exhausted")
+        case = verify.shrink("overdraw", case)
+        self.assertEqual(case.actions, ())
+        self.assertEqual(len(case.shoe), 4)
@@ -9,5 +9,8 @@ urlpatterns = [
     path('api/bet/', views.bet, name='bet'),
     path('api/double/', views.double, name='double'),
     path('api/split/', views.split, name='split'),
+    path('api/surrender/', views.surrender, name='surrender'),
+    path('api/insurance/', views.insurance, name='insurance'),
+    path('api/shoe-pool/', views.shoe_pool, name='shoe_pool'),
     path('api/reset/', views.reset_game, name='reset_game'),
 ]
\ No newline at end of file
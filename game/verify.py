@@ -0,0 +1,226 @@
+import argparse
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields, replace
+
+from . import fast_engine
+from .logic import (
+    BLACKJACK_PAYOUTS,
+    DEFAULT_RULES,
+    RANKS,
+    SUITS,
+    Card,
+    Deck,
+    GameState,
+    Rules,
+    place_bet,
+    player_double_down,
+    player_hit,
+    player_insurance,
+    player_split,
+    player_stand,
+    player_surrender,
+    start_game,
+)
+
+#Differential harness: plays the same seeded shoes and action sequences through the reference functions in logic.py and through
+#each optimized engine, and reports any round where bankroll or outcome differ. Rounds are spread over worker processes; the first
+#mismatch found is shrunk to a minimal reproducer.
+#
+#    python -m game.verify --rounds 5000000
+#    python manage.py verify_engines --rounds 5000000
+
+#Optimized engines under test. Each takes (shoe, bankroll, bet, actions, insurance, rules) and returns
+#(bankroll, status, dealer best total, cards left), with the shoe drawn from the end.
+ENGINES = {
+    "int-cards": fast_engine.play_round,
+}
+
+ACTIONS = ("hit", "stand", "double", "split", "surrender")
+_PLAYER_ACTIONS = {
+    "hit": player_hit,
+    "stand": player_stand,
+    "double": player_double_down,
+    "split": player_split,
+    "surrender": player_surrender,
+}
+
+RULE_GRID = tuple(
+    Rules(decks=decks, hit_soft_17=h17, blackjack_payout=payout, double_after_split=das, surrender=surrender, insurance=insurance, max_splits=max_splits)
+    for decks, h17, payout, das, surrender, insurance, max_splits in itertools.product(
+        (1, 2, 6, 8), (False, True), BLACKJACK_PAYOUTS, (False, True), (False, True), (False, True), (0, 1, 3)
+    )
+)
+
+
+@dataclass(frozen=True)
+class Case:
+    rules: Rules
+    bankroll: int
+    bet: int
+    insurance: bool
+    shoe: tuple  # card codes (rank index * 4 + suit index), drawn from the end
+    actions: tuple
+
+    def describe(self) -> str:
+        cards = ", ".join(f"{RANKS[c // 4]}{SUITS[c % 4]}" for c in reversed(self.shoe))
+        return (
+            f"rules:     {self.rules}\n"
+            f"bankroll:  {self.bankroll}  bet: {self.bet}  insurance: {self.insurance}\n"
+            f"shoe:      {cards}  (in draw order)\n"
+            f"actions:   {', '.join(self.actions) or '(none)'}"
+        )
+
+#Builds a random round from a seed. Shoes are a random sample of a rules.decks-deck shoe, long enough for any realistic round.
+def make_case(seed: int) -> Case:
+    rng = random.Random(seed)
+    rules = rng.choice(RULE_GRID)
+    bankroll = rng.choice((10, 100, 1000))
+    bet = rng.randint(1, bankroll)
+    shoe = tuple(c % 52 for c in rng.sample(range(52 * rules.decks), min(52 * rules.decks, 120)))
+    actions = tuple(rng.choice(ACTIONS) for _ in range(rng.randint(0, 12)))
+    return Case(rules, bankroll, bet, rng.random() < 0.5, shoe, actions)
+
+# ---------------------------------------
+# Reference runner
+# ---------------------------------------
+
+class _FixedShoe(Deck):
+    #Unlike Deck, never falls back to a fresh shoe, so every run of a case sees exactly the same cards.
+    def draw(self) -> Card:
+        if not self.cards:
+            raise fast_engine.ShoeExhausted()
+        return self.cards.pop()
+
+def run_reference(case: Case) -> tuple:
+    deck = _FixedShoe([Card(RANKS[c // 4], SUITS[c % 4]) for c in case.shoe], case.rules.decks)
+    state = GameState(deck=deck, bankroll=case.bankroll, rules=case.rules)
+    state = place_bet(state, case.bet)
+    if state.status != "playing":
+        return (state.bankroll, state.status, 0, len(deck.cards))
+
+    state = start_game(state)
+    if state.status == "insurance_offered":
+        state = player_insurance(state, case.insurance)
+        if state.status == "insurance_offered":  # could not afford it
+            state = player_insurance(state, False)
+
+    actions = iter(case.actions)
+    while state.status in ("playing", "split_playing"):
+        state = _PLAYER_ACTIONS[next(actions, "stand")](state)
+    return (state.bankroll, state.status, state.dealer.best_value(), len(deck.cards))
+
+def run_engine(name: str, case: Case) -> tuple:
+    return ENGINES[name](list(case.shoe), case.bankroll, case.bet, case.actions, case.insurance, case.rules)
+
+#Returns (reference, engine) results when they differ, else None. Only a case the reference itself runs out of cards on is skipped;
+#an engine that runs dry where the reference did not is a mismatch.
+def check(name: str, case: Case):
+    try:
+        expected = run_reference(case)
+    except fast_engine.ShoeExhausted:
+        return None
+    try:
+        actual = run_engine(name, case)
+    except fast_engine.ShoeExhausted:
+        actual = "shoe exhausted"
+    return (expected, actual) if expected != actual else None
+
+# ---------------------------------------
+# Shrinking
+# ---------------------------------------
+
+def _smaller_cases(case: Case):
+    for i in reversed(range(len(case.actions))):
+        yield replace(case, actions=case.actions[:i] + case.actions[i + 1:])
+    #Cards at the front of the shoe are drawn last; drop them first.
+    if len(case.shoe) > 4:
+        yield replace(case, shoe=case.shoe[len(case.shoe) // 2:])
+        yield replace(case, shoe=case.shoe[1:])
+    for i, code in enumerate(case.shoe):
+        for rank in range(code // 4):
+            yield replace(case, shoe=case.shoe[:i] + (rank * 4,) + case.shoe[i + 1:])
+        if code % 4:
+            yield replace(case, shoe=case.shoe[:i] + (code - code % 4,) + case.shoe[i + 1:])
+    if case.bet > 1:
+        yield replace(case, bet=case.bet // 2)
+    if case.bankroll > case.bet:
+        yield replace(case, bankroll=max(case.bet, case.bankroll // 2))
+    if case.insurance:
+        yield replace(case, insurance=False)
+    for f in fields(Rules):
+        if f.init and getattr(case.rules, f.name) != getattr(DEFAULT_RULES, f.name):
+            yield replace(case, rules=replace(case.rules, **{f.name: getattr(DEFAULT_RULES, f.name)}))
+
+#Greedily applies the first simplification that still fails until none does.
+def shrink(name: str, case: Case) -> Case:
+    progress = True
+    while progress:
+        progress = False
+        for smaller in _smaller_cases(case):
+            if check(name, smaller):
+                case = smaller
+                progress = True
+                break
+    return case
+
+# ---------------------------------------
+# Parallel driver
+# ---------------------------------------
+
+def _check_range(name: str, start: int, stop: int) -> tuple:
+    for seed in range(start, stop):
+        if check(name, make_case(seed)):
+            return (stop - start, seed)
+    return (stop - start, None)
+
+#Checks `rounds` seeded rounds against engine `name`, starting at seed `seed`. Returns None if every round matched, otherwise the
+#shrunk failing case.
+def verify(name: str, rounds: int, seed: int = 0, workers: int | None = None, chunk: int = 20000) -> Case | None:
+    if rounds <= 0:
+        raise ValueError("rounds must be positive.")
+    workers = workers or os.cpu_count() or 1
+    starts = list(range(seed, seed + rounds, chunk))
+    stops = [min(start + chunk, seed + rounds) for start in starts]
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for _, failed in pool.map(_check_range, [name] * len(starts), starts, stops):
+            if failed is not None:
+                failures.append(failed)
+    if not failures:
+        return None
+    return shrink(name, make_case(min(failures)))
+
+def main(argv=None, out=print) -> int:
+    parser = argparse.ArgumentParser(description="Check optimized blackjack engines against the reference rules in game/logic.py.")
+    add_arguments(parser)
+    return run(vars(parser.parse_args(argv)), out)
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+def add_arguments(parser):
+    parser.add_argument("--rounds", type=_positive_int, default=1_000_000, help="Number of random rounds per engine.")
+    parser.add_argument("--seed", type=int, default=0, help="First seed; rounds use seeds seed .. seed + rounds - 1.")
+    parser.add_argument("--workers", type=_positive_int, default=None, help="Worker processes (default: one per core).")
+    parser.add_argument("--engine", choices=sorted(ENGINES), action="append", help="Engine to check (default: all).")
+
+def run(options: dict, out=print) -> int:
+    status = 0
+    for name in options["engine"] or sorted(ENGINES):
+        case = verify(name, options["rounds"], options["seed"], options["workers"])
+        if case is None:
+            out(f"{name}: {options['rounds']} rounds match the reference.")
+            continue
+        expected, actual = check(name, case)
+        out(f"{name}: MISMATCH. Minimal reproducer:\n{case.describe()}\nreference: {expected}\n{name}: {actual}")
+        status = 1
+    return status
+
+if __name__ == "__main__":
+    raise SystemExit(main())
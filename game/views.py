@@ -1,37 +1,47 @@
-import pickle
-import base64
+from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import render, redirect
 from django.views.decorators.http import require_POST
 from .logic import (
     GameState,
+    Rules,
     start_game,
     player_hit,
     player_stand,
     player_double_down,
     player_split,
+    player_surrender,
+    player_insurance,
     place_bet,
+    shoe_pool_metrics,
 )
-
-SESSION_KEY = "bj_state"
-
-#Saves gameState as a byte string with the SESSION_KEY. 
-def _save_state(request, state: GameState):
-    pickled = pickle.dumps(state)
-    encoded = base64.b64encode(pickled).decode('utf-8')
-    request.session[SESSION_KEY] = encoded
-    request.session.modified = True
-
-#Check SESSION_KEY to see if a session exists. Will load gameState from it if it does. 
-def _load_state(request) -> GameState | None:
-    data = request.session.get(SESSION_KEY)
-    if not data:
-        return None
-    try:
-        decoded = base64.b64decode(data)
-        return pickle.loads(decoded)
-    except Exception:
-        return None
+from .state_store import GameStateStore
+
+STORE = GameStateStore(settings.GAME_STATE_DIR, settings.GAME_STATE_SHARDS, settings.GAME_STATE_COMPACT_AFTER)
+RULES = Rules(**settings.GAME_RULES)
+
+#The session only identifies the player; the game state itself lives in STORE. A client without a session has no game, so only bet()
+#passes create=True and gets a new session key to store under.
+def _player_key(request, create: bool = False) -> str | None:
+    if not request.session.session_key and create:
+        request.session.save()
+    return request.session.session_key
+
+#Loads the player's gameState, passes it (or None if there is no game) to fn and saves what fn returns, all under the store's lock for
+#that player, so two requests from the same player can't both act on the same state. Returns the saved state, or None if fn returned None.
+def _update_state(request, fn, create: bool = False) -> GameState | None:
+    key = _player_key(request, create)
+    if key is None:
+        return fn(None)
+    return STORE.update(key, fn)
+
+#Applies a player action from logic.py to the game in progress. Returns None if there is no game.
+def _play(request, action) -> GameState | None:
+    return _update_state(request, lambda state: action(state) if state else None)
+
+#Surrender is only offered on the first move of an unsplit hand, and only if the table's rules allow it.
+def _can_surrender(state: GameState) -> bool:
+    return state.rules.surrender and state.status == "playing" and not state.hands and len(state.player.cards) == 2
 
 #HTML main page. Loads web applications and elements. 
 def index(request):
@@ -40,19 +50,18 @@ def index(request):
 #Calls start_game() from logic.py. Checks if dealer has blackjack. Ensure player places a bet first.
 @require_POST
 def new_game(request):
-    state = _load_state(request)
-    if not state or state.current_bet == 0:
+    state = _update_state(request, lambda state: start_game(state) if state and state.current_bet else None)
+    if not state:
         return JsonResponse({"error": "Place a bet first"}, status=400)
-    state = start_game(state)
-    _save_state(request, state)
 
     # Determine dealer cards payload
-    dealer_cards = [str(c) for c in state.dealer.cards] if state.dealer.is_blackjack() else [str(state.dealer.cards[0]), "Hidden"] if state.dealer.cards else []
+    dealer_cards = [str(c) for c in state.dealer.cards] if state.dealer.is_blackjack() and state.status != "insurance_offered" else [str(state.dealer.cards[0]), "Hidden"] if state.dealer.cards else []
 
     return JsonResponse({
         "message": state.message,
         "bankroll": state.bankroll,
         "status": state.status,
+        "can_surrender": _can_surrender(state),
         "hands": [[str(c) for c in state.player.cards]],
         "active": 0,
         "dealer": dealer_cards,
@@ -61,13 +70,10 @@ def new_game(request):
 #Calls player_hit(). Updates gameState with updated player hand/ 
 @require_POST
 def hit(request):
-    state = _load_state(request)
+    state = _play(request, player_hit)
     if not state:
         return JsonResponse({"error": "No game in progress"}, status=400)
 
-    state = player_hit(state)
-    _save_state(request, state)
-
     hands_payload = [[str(c) for c in h.cards] for h in state.hands] if state.hands else [[str(c) for c in state.player.cards]]
     dealer_payload = [str(state.dealer.cards[0]), "Hidden"] if state.status in ("playing", "split_playing") and len(state.dealer.cards) >= 1 else [str(c) for c in state.dealer.cards]
 
@@ -75,6 +81,7 @@ def hit(request):
         "message": state.message,
         "bankroll": state.bankroll,
         "status": state.status,
+        "can_surrender": _can_surrender(state),
         "hands": hands_payload,
         "active": state.active_hand_index,
         "dealer": dealer_payload,
@@ -83,16 +90,15 @@ def hit(request):
 #Calls player_stand. Ends player's turn and goes to dealer's turn. 
 @require_POST
 def stand(request):
-    state = _load_state(request)
+    state = _play(request, player_stand)
     if not state:
         return JsonResponse({"error": "No game in progress"}, status=400)
-    state = player_stand(state)
-    _save_state(request, state)
 
     return JsonResponse({
         "message": state.message,
         "bankroll": state.bankroll,
         "status": state.status,
+        "can_surrender": _can_surrender(state),
         "hands": [[str(c) for c in h.cards] for h in state.hands] if state.hands else [ [str(c) for c in state.player.cards] ],
         "active": state.active_hand_index,
         "dealer": [str(c) for c in state.dealer.cards],
@@ -102,21 +108,27 @@ def stand(request):
 @require_POST
 def bet(request):
     import json
-    state = _load_state(request) or GameState()
     data = json.loads(request.body or '{}')
     amount = data.get("amount", 0)
-    state = place_bet(state, amount)
-    _save_state(request, state)
-    
+    placed = False
+
     #If bet is successful, start the game immediately
-    if state.status == "playing":
-        state = start_game(state)
-        _save_state(request, state)
+    def bet_and_deal(state):
+        nonlocal placed
+        state = place_bet(state or GameState(rules=RULES), amount)
+        if state.status == "playing":
+            placed = True
+            state = start_game(state)
+        return state
+
+    state = _update_state(request, bet_and_deal, create=True)
+    if placed:
         dealer_cards = [str(state.dealer.cards[0]), "Hidden"] if state.dealer.cards else []
         return JsonResponse({
             "message": state.message,
             "bankroll": state.bankroll,
             "status": state.status,
+        "can_surrender": _can_surrender(state),
             "hands": [[str(c) for c in state.player.cards]],
             "active": 0,
             "dealer": dealer_cards,
@@ -126,18 +138,16 @@ def bet(request):
         "message": state.message,
         "bankroll": state.bankroll,
         "status": state.status,
+        "can_surrender": _can_surrender(state),
     })
 
 #Calls player_double_down(). Double's the player's bet and draws one card. 
 @require_POST
 def double(request):
-    state = _load_state(request)
+    state = _play(request, player_double_down)
     if not state:
         return JsonResponse({"error": "No game in progress"}, status=400)
 
-    state = player_double_down(state)
-    _save_state(request, state)
-
     hands_payload = [[str(c) for c in h.cards] for h in state.hands] if state.hands else [[str(c) for c in state.player.cards]]
     dealer_payload = [str(state.dealer.cards[0]), "Hidden"] if state.status in ("playing", "split_playing") and len(state.dealer.cards) >= 1 else [str(c) for c in state.dealer.cards]
 
@@ -145,6 +155,7 @@ def double(request):
         "message": state.message,
         "bankroll": state.bankroll,
         "status": state.status,
+        "can_surrender": _can_surrender(state),
         "hands": hands_payload,
         "active": state.active_hand_index,
         "dealer": dealer_payload,
@@ -153,27 +164,62 @@ def double(request):
 #Calls player_split. Allows player to split if cards are the same rank. 
 @require_POST
 def split(request):
-    state = _load_state(request)
+    state = _play(request, player_split)
     if not state:
         return JsonResponse({"error": "No game in progress"}, status=400)
-    state = player_split(state)
-    _save_state(request, state)
     return JsonResponse({
         "message": state.message,
         "bankroll": state.bankroll,
         "status": state.status,
+        "can_surrender": _can_surrender(state),
         "hands": [[str(c) for c in h.cards] for h in state.hands],
         "active": state.active_hand_index,
         "dealer": [str(state.dealer.cards[0]), "Hidden"] if state.dealer.cards else [],
     })
 
-#Reset button. Resets session by deleteing the SESSION_KEY and setting bankroll back to 1000. Sets status to waiting_for_bet.  
+#Calls player_surrender. Gives up the hand for half the bet back, if the table allows surrender.
+@require_POST
+def surrender(request):
+    state = _play(request, player_surrender)
+    if not state:
+        return JsonResponse({"error": "No game in progress"}, status=400)
+    return JsonResponse({
+        "message": state.message,
+        "bankroll": state.bankroll,
+        "status": state.status,
+        "can_surrender": _can_surrender(state),
+        "hands": [[str(c) for c in state.player.cards]],
+        "active": 0,
+        "dealer": [str(c) for c in state.dealer.cards] if state.status == "waiting_for_bet" else [str(state.dealer.cards[0]), "Hidden"] if state.dealer.cards else [],
+    })
+
+#Calls player_insurance with the player's answer ({"accept": true/false}) when the dealer shows an Ace.
+@require_POST
+def insurance(request):
+    import json
+    data = json.loads(request.body or '{}')
+    accept = bool(data.get("accept", False))
+    state = _play(request, lambda state: player_insurance(state, accept))
+    if not state:
+        return JsonResponse({"error": "No game in progress"}, status=400)
+    return JsonResponse({
+        "message": state.message,
+        "bankroll": state.bankroll,
+        "status": state.status,
+        "can_surrender": _can_surrender(state),
+        "hands": [[str(c) for c in state.player.cards]],
+        "active": 0,
+        "dealer": [str(state.dealer.cards[0]), "Hidden"] if state.status in ("playing", "insurance_offered") else [str(c) for c in state.dealer.cards],
+    })
+
+#Shoe pool health for this worker: ready shoes, shoes taken and how often a deal had to shuffle inline (starved).
+def shoe_pool(request):
+    return JsonResponse({"pools": shoe_pool_metrics()})
+
+#Reset button. Resets the game by deleting the player's stored state, so the next bet starts a new game with a bankroll of 1000. Sets status to waiting_for_bet.  
 @require_POST
 def reset_game(request):
-    # Clear the session data
-    if SESSION_KEY in request.session:
-        del request.session[SESSION_KEY]
-    # Reset bankroll to initial value
-    request.session['bankroll'] = 1000
-    request.session.modified = True
+    # Clear the stored game state
+    if request.session.session_key:
+        STORE.delete(request.session.session_key)
     return JsonResponse({"message": "Game reset successfully", "bankroll": 1000, "status": "waiting_for_bet"})
\ No newline at end of file
@@ -100,6 +100,24 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Game-state store (see game/state_store.py)
+
+GAME_STATE_DIR = BASE_DIR / 'game_state'
+GAME_STATE_SHARDS = 16
+# A shard compacts itself once it holds this many superseded records and they are at least half of it (None turns that off; then
+# schedule 'python manage.py compact_game_state' instead).
+GAME_STATE_COMPACT_AFTER = 4096
+
+# Table rules for new games (keyword arguments to game.logic.Rules), e.g. {'decks': 6, 'hit_soft_17': True, 'surrender': True}
+# Rerun 'python manage.py build_outcome_tables' after changing them.
+
+GAME_RULES = {}
+
+# Number of ready shuffled shoes kept per deck count (see game.logic.ShoePool)
+
+SHOE_POOL_SIZE = 4
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 